@@ -3,6 +3,8 @@ from src.common import *
 from src.fileselection import *
 from src.cleanup import *
 import pandas as pd
+import numpy as np
+import uuid
 
 page_setup()
 
@@ -14,7 +16,7 @@ if st.session_state["data_preparation_done"]:
         reset_dataframes()
         st.session_state["data_preparation_done"] = False
         st.experimental_rerun()
-    show_table(pd.concat([st.session_state.md, st.session_state.data], axis=1), title="FeatureMatrix-scaled-centered")
+    show_table(get_joined_data(st.session_state.data_version), title="FeatureMatrix-scaled-centered")
 else:
     st.info(
         """💡 Once you are happy with the results, don't forget to click the **Submit Data for Statistics!** button."""
@@ -83,7 +85,7 @@ else:
                 "attribute for sample selection",
                 md.columns,
             )
-            sample_row = c2.selectbox("sample selection", set(md[sample_column].dropna()))
+            sample_row = c2.selectbox("sample selection", pd.unique(md[sample_column].dropna()))
             samples = ft[md[md[sample_column] == sample_row].index]
             samples_md = md.loc[samples.columns]
 
@@ -95,9 +97,7 @@ else:
             st.markdown(
                 "Select blanks (excluding samples and pools) based on the following table."
             )
-            non_samples_md = md.loc[
-                [index for index in md.index if index not in samples.columns]
-            ]
+            non_samples_md = md.loc[~md.index.isin(samples.columns)]
             st.dataframe(inside_levels(non_samples_md))
             c1, c2 = st.columns(2)
 
@@ -105,7 +105,7 @@ else:
                 "attribute for blank selection", non_samples_md.columns
             )
             blank_row = c2.selectbox(
-                "blank selection", set(non_samples_md[blank_column].dropna())
+                "blank selection", pd.unique(non_samples_md[blank_column].dropna())
             )
             blanks = ft[non_samples_md[non_samples_md[blank_column] == blank_row].index]
             with st.expander(f"Selected blanks {blanks.shape}"):
@@ -139,9 +139,11 @@ Features with intensity ratio of (blank mean)/(sample mean) above the threshold
             st.markdown("##### Imputation")
 
             c1, c2 = st.columns(2)
+            n_values = ft.size
+            n_missing = n_values - np.count_nonzero(ft.to_numpy())
             c2.metric(
                 f"total missing values",
-                str((ft == 0).to_numpy().mean() * 100)[:4] + " %",
+                f"{n_missing / n_values * 100:.2f} %",
             )
             imputation = c1.checkbox("Impute missing values?", False, help=f"These values will be filled with random number between 0 and {cutoff_LOD} (Limit of Detection) during imputation.")
             if imputation:
@@ -150,12 +152,16 @@ Features with intensity ratio of (blank mean)/(sample mean) above the threshold
                 with st.expander(f"Imputed data {ft.shape}"):
                     show_table(ft, "imputed")
 
+            # single precision is plenty for intensities and halves the memory for all statistics
+            ft = ft.astype("float32", copy=False)
+
             v_space(2)
             _, c1, _ = st.columns(3)
             if c1.button("**Submit Data for Statistics!**"):
                 st.session_state["md"], st.session_state["data"] = transpose_and_scale(
                     ft, md
                 )
+                st.session_state["data_version"] = uuid.uuid4().hex
                 st.session_state["data_preparation_done"] = True
                 st.experimental_rerun()
             v_space(2)
@@ -40,6 +40,7 @@ if not st.session_state.data.empty:
         tabs = st.tabs(["📊 Normal distribution", "📊 Equal variance"])
         with tabs[0]:
             fig = test_normal_distribution(
+                st.session_state.data_version,
                 "ATTRIBUTE_" + st.session_state.test_attribute,
                 st.session_state.test_options,
             )
@@ -47,6 +48,7 @@ if not st.session_state.data.empty:
                 show_fig(fig, "test-normal-distribution")
         with tabs[1]:
             fig = test_equal_variance(
+                st.session_state.data_version,
                 "ATTRIBUTE_" + st.session_state.test_attribute,
                 st.session_state.test_options,
             )
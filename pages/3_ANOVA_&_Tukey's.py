@@ -29,7 +29,7 @@ if not st.session_state.data.empty:
     c1.button("Run ANOVA", key="run_anova")
     if st.session_state.run_anova:
         st.session_state.df_anova = anova(
-            st.session_state.data,
+            st.session_state.data_version,
             "ATTRIBUTE_" + st.session_state.anova_attribute,
             corrections_map[st.session_state.p_value_correction]
         )
@@ -57,6 +57,7 @@ if not st.session_state.data.empty:
         )
         if st.session_state.run_tukey:
             st.session_state.df_tukey = tukey(
+                st.session_state.data_version,
                 st.session_state.df_anova,
                 "ATTRIBUTE_" + st.session_state.anova_attribute,
                 st.session_state.tukey_elements,
@@ -93,8 +94,12 @@ if not st.session_state.data.empty:
                 key="anova_metabolite",
             )
             fig = get_metabolite_boxplot(
-                st.session_state.df_anova,
+                st.session_state.data_version,
                 st.session_state.anova_metabolite,
+                "ATTRIBUTE_" + st.session_state.anova_attribute,
+                st.session_state.df_anova.loc[
+                    st.session_state.df_anova["metabolite"] == st.session_state.anova_metabolite, "p"
+                ].iloc[0],
             )
             show_fig(fig, f"anova-{st.session_state.anova_metabolite}")
 
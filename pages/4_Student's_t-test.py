@@ -50,6 +50,7 @@ if not st.session_state.data.empty:
 
     if c2.button("Run t-test", disabled=(len(st.session_state.ttest_options) != 2)):
         st.session_state.df_ttest = gen_ttest_data(
+            st.session_state.data_version,
             "ATTRIBUTE_" + st.session_state.ttest_attribute,
             st.session_state.ttest_options,
             st.session_state.ttest_paired,
@@ -71,10 +72,17 @@ if not st.session_state.data.empty:
             cols[0].selectbox(
                 "metabolite", st.session_state.df_ttest.index, key="ttest_metabolite"
             )
-            fig = ttest_boxplot(st.session_state.df_ttest,
-                st.session_state.ttest_metabolite
+            fig = ttest_boxplot(
+                st.session_state.data_version,
+                st.session_state.ttest_metabolite,
+                st.session_state.df_ttest["st.session_state.ttest_attribute"].iloc[0],
+                [st.session_state.df_ttest["A"].iloc[0], st.session_state.df_ttest["B"].iloc[0]],
+                st.session_state.df_ttest.loc[st.session_state.ttest_metabolite, "p-corrected"],
             )
             show_fig(fig, f"ttest-boxplot-{st.session_state.ttest_metabolite}", False)
 
         with tabs[2]:
+            st.info(
+                "💡 The table contains T, degrees of freedom, p-values, the 95 % confidence interval of the mean difference and Cohen's d. Bayes factor (BF10) and achieved power are not calculated."
+            )
             show_table(st.session_state.df_ttest, "t-test-data")
@@ -1,26 +1,32 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import pingouin as pg
+import scipy.stats
 import plotly.express as px
 import plotly.graph_objects as go
+from src.common import p_value_correction
 
 
-def gen_anova_data(df, columns, groups_col):
-    for col in columns:
-        result = pg.anova(data=df, dv=col, between=groups_col, detailed=True).set_index(
-            "Source"
-        )
-        p = result.loc[groups_col, "p-unc"]
-        f = result.loc[groups_col, "F"]
-        yield col, p, f
+def anova_f_p(X, codes, k):
+    """Return F and p-values of a one-way ANOVA for each column of X, with the k groups given by codes."""
+    n = len(codes)
+    counts = np.bincount(codes, minlength=k).astype(X.dtype)
+    # group sums via the group indicator matrix
+    group_means = (np.eye(k, dtype=X.dtype)[codes].T @ X) / counts[:, None]
+    grand = X.mean(axis=0)
+    # between and within group sum of squares
+    ssb = (counts[:, None] * (group_means - grand) ** 2).sum(axis=0)
+    ssw = ((X - group_means[codes]) ** 2).sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        f = (ssb / (k - 1)) / (ssw / (n - k))
+    return f, scipy.stats.f.sf(f, k - 1, n - k)
 
 
 def add_p_correction_to_anova(df, correction):
     # add Bonferroni corrected p-values for multiple testing correction
     if "p-corrected" not in df.columns:
         df.insert(2, "p-corrected",
-                  pg.multicomp(df["p"].astype(float), method=correction)[1])
+                  p_value_correction(df["p"], correction))
     # add significance
     if "significant" not in df.columns:
         df.insert(3, "significant", df["p-corrected"] < 0.05)
@@ -29,17 +35,23 @@ def add_p_correction_to_anova(df, correction):
     return df
 
 
-@st.cache_data
-def anova(df, attribute, correction):
+# cached as resource to avoid copying the results on every rerun,
+# the returned tables (also from tukey) must not be modified;
+# data and meta data are read from session state and keyed by data_version
+@st.cache_resource
+def anova(data_version, attribute, correction):
+    data = st.session_state.data
+    # one-way ANOVA for all metabolites at once, samples without a group are ignored
+    codes, _ = pd.factorize(st.session_state.md.loc[data.index, attribute])
+    X = data.to_numpy(dtype="float32")[codes >= 0]
+    codes = codes[codes >= 0]
+    f, p = anova_f_p(X, codes, codes.max() + 1)
     df = pd.DataFrame(
-        np.fromiter(
-            gen_anova_data(
-                pd.concat([df, st.session_state.md], axis=1),
-                df.columns,
-                attribute,
-            ),
-            dtype=[("metabolite", "U100"), ("p", "f"), ("F", "f")],
-        )
+        {
+            "metabolite": data.columns.to_numpy(),
+            "p": p.astype("float32"),
+            "F": f.astype("float32"),
+        }
     )
     df = df.dropna()
     df = add_p_correction_to_anova(df, correction)
@@ -48,21 +60,24 @@ def anova(df, attribute, correction):
 
 @st.cache_resource
 def get_anova_plot(anova):
-    # first plot insignificant features
+    significant = anova["significant"].to_numpy()
+    log_f = np.log(anova["F"].to_numpy())
+    neg_log_p = -np.log(anova["p"].to_numpy())
+    # first plot insignificant features (WebGL, these can be thousands of points)
     fig = px.scatter(
-        x=anova[anova["significant"] == False]["F"].apply(np.log),
-        y=anova[anova["significant"] == False]["p"].apply(
-            lambda x: -np.log(x)),
+        x=log_f[~significant],
+        y=neg_log_p[~significant],
         template="plotly_white",
         width=600,
         height=600,
+        render_mode="webgl",
     )
     fig.update_traces(marker_color="#696880")
 
     # plot significant features
     fig.add_scatter(
-        x=anova[anova["significant"]]["F"].apply(np.log),
-        y=anova[anova["significant"]]["p"].apply(lambda x: -np.log(x)),
+        x=log_f[significant],
+        y=neg_log_p[significant],
         mode="markers+text",
         text=anova["metabolite"].iloc[:6],
         textposition="top left",
@@ -87,12 +102,14 @@ def get_anova_plot(anova):
 
 
 @st.cache_resource
-def get_metabolite_boxplot(anova, metabolite):
-    attribute = "ATTRIBUTE_"+st.session_state.anova_attribute
-    p_value = anova.set_index("metabolite")._get_value(metabolite, "p")
-    df = pd.concat([st.session_state.data, st.session_state.md], axis=1)[
-        [attribute, metabolite]
-    ]
+def get_metabolite_boxplot(data_version, metabolite, attribute, p_value):
+    # small arguments only, so the cache key is cheap, data_version stands for the data in session state
+    df = pd.DataFrame(
+        {
+            attribute: st.session_state.md[attribute],
+            metabolite: st.session_state.data[metabolite],
+        }
+    )
     title = f"{metabolite}<br>p-value: {str(p_value)[:6]}"
     fig = px.box(
         df,
@@ -114,28 +131,29 @@ def get_metabolite_boxplot(anova, metabolite):
     return fig
 
 
-def gen_pairwise_tukey(df, metabolites, attribute):
-    """Yield results for pairwise Tukey test for all metabolites between two options within the attribute."""
-    for metabolite in metabolites:
-        tukey = pg.pairwise_tukey(df, dv=metabolite, between=attribute)
-        yield (
-            metabolite,
-            tukey.loc[0, "diff"],
-            tukey.loc[0, "p-tukey"],
-            attribute.replace("ATTRIBUTE_", ""),
-            tukey.loc[0, "A"],
-            tukey.loc[0, "B"],
-            tukey.loc[0, "mean(A)"],
-            tukey.loc[0, "mean(B)"],
-        )
+def tukey_two_group(A, B):
+    """Return mean(A), mean(B), their difference and Tukey's HSD p-values for each column of A and B.
+
+    Only for two groups, where the studentized range p-value has a closed form. More groups would need
+    scipy.stats.studentized_range.sf, which integrates numerically for every single value.
+    """
+    n_A, n_B = len(A), len(B)
+    mean_A, mean_B = A.mean(axis=0), B.mean(axis=0)
+    diff = mean_A - mean_B
+    dof = n_A + n_B - 2
+    ms_within = ((n_A - 1) * A.var(axis=0, ddof=1) + (n_B - 1) * B.var(axis=0, ddof=1)) / dof
+    se = np.sqrt(ms_within / n_A + ms_within / n_B)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # studentized range with two groups: P(q > sqrt(2)*|t|) equals the two-sided t-test p-value
+        p = 2 * scipy.stats.t.sf(np.abs(diff / se), dof)
+    return mean_A, mean_B, diff, np.clip(p, 0, 1)
 
 
 def add_p_value_correction_to_tukeys(tukey, correction):
     if "p-corrected" not in tukey.columns:
         # add Bonferroni corrected p-values
         tukey.insert(
-            3, "p-corrected", pg.multicomp(
-                tukey["stats_p"].astype(float), method=correction)[1]
+            3, "p-corrected", p_value_correction(tukey["stats_p"], correction)
         )
         # add significance
         tukey.insert(4, "stats_significant", tukey["p-corrected"] < 0.05)
@@ -144,31 +162,30 @@ def add_p_value_correction_to_tukeys(tukey, correction):
     return tukey
 
 
-@st.cache_data
-def tukey(df, attribute, elements, correction):
-    significant_metabolites = df[df["significant"]]["metabolite"]
-    data = pd.concat(
-        [
-            st.session_state.data.loc[:, significant_metabolites],
-            st.session_state.md.loc[:, attribute],
-        ],
-        axis=1,
-    )
-    data = data[data[attribute].isin(elements)]
+@st.cache_resource
+def tukey(data_version, df, attribute, elements, correction):
+    significant_metabolites = df.loc[df["significant"], "metabolite"].to_numpy()
+    # slice samples of the two options and significant metabolites in one go
+    data = st.session_state.data
+    groups = st.session_state.md.loc[data.index, attribute].to_numpy()
+    row_mask = np.isin(groups, elements)
+    X = data.to_numpy()[row_mask][:, data.columns.get_indexer(significant_metabolites)]
+    groups = groups[row_mask]
+    # Tukey's HSD for the two selected options, computed for all metabolites at once
+    a, b = sorted(elements)
+    A, B = X[groups == a], X[groups == b]
+    mean_A, mean_B, diff, p = tukey_two_group(A, B)
     tukey = pd.DataFrame(
-        np.fromiter(
-            gen_pairwise_tukey(data, significant_metabolites, attribute),
-            dtype=[
-                ("stats_metabolite", "U100"),
-                (f"diff", "f"),
-                ("stats_p", "f"),
-                ("attribute", "U100"),
-                ("A", "U100"),
-                ("B", "U100"),
-                ("mean(A)", "f"),
-                ("mean(B)", "f"),
-            ],
-        )
+        {
+            "stats_metabolite": significant_metabolites,
+            "diff": diff.astype("float32"),
+            "stats_p": p.astype("float32"),
+            "attribute": attribute.replace("ATTRIBUTE_", ""),
+            "A": a,
+            "B": b,
+            "mean(A)": mean_A.astype("float32"),
+            "mean(B)": mean_B.astype("float32"),
+        }
     )
     tukey = tukey.dropna()
     tukey = add_p_value_correction_to_tukeys(tukey, correction)
@@ -177,16 +194,19 @@ def tukey(df, attribute, elements, correction):
 
 @st.cache_resource
 def get_tukey_volcano_plot(df):
+    # tukey() sorts by p-value and the corrected p-values keep that order,
+    # so the significant metabolites are the first rows of the table
+    n_significant = df["stats_significant"].sum()
+    diff = df["diff"].to_numpy()
+    neg_log_p = -np.log(df["stats_p"].to_numpy())
     # create figure
     fig = px.scatter(template="plotly_white")
 
     # plot insignificant values
     fig.add_trace(
-        go.Scatter(
-            x=df[df["stats_significant"] == False]["diff"],
-            y=df[df["stats_significant"] == False]["stats_p"].apply(
-                lambda x: -np.log(x)
-            ),
+        go.Scattergl(
+            x=diff[n_significant:],
+            y=neg_log_p[n_significant:],
             mode="markers",
             marker_color="#696880",
             name="insignificant",
@@ -196,9 +216,8 @@ def get_tukey_volcano_plot(df):
     # plot significant values
     fig.add_trace(
         go.Scatter(
-            x=df[df["stats_significant"]]["diff"],
-            y=df[df["stats_significant"]]["stats_p"].apply(
-                lambda x: -np.log(x)),
+            x=diff[:n_significant],
+            y=neg_log_p[:n_significant],
             mode="markers+text",
             text=df["stats_metabolite"].iloc[:5],
             textposition="top right",
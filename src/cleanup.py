@@ -59,11 +59,13 @@ def check_columns(md, ft):
 
 @st.cache_data
 def inside_levels(df):
+    # one value count per column gives both the levels and their counts
+    counts = [df[col].value_counts() for col in df]
     df = pd.DataFrame(
         {
             "ATTRIBUTES": df.columns,
-            "LEVELS": [set(df[col].dropna().astype(str).to_list()) for col in df],
-            "COUNTS": [df[col].value_counts().to_list() for col in df],
+            "LEVELS": [set(c.index.astype(str)) for c in counts],
+            "COUNTS": [c.to_list() for c in counts],
         }
     )
     return df
@@ -188,7 +190,7 @@ def transpose_and_scale(feature_df, meta_data_df):
         )
 
     scaled = pd.DataFrame(
-        StandardScaler().fit_transform(feature_df),
+        StandardScaler().fit_transform(feature_df).astype("float32", copy=False),
         index=feature_df.index,
         columns=feature_df.columns,
     )
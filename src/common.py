@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import io
 import uuid
 
@@ -17,6 +18,23 @@ def reset_dataframes():
         st.session_state[key] = pd.DataFrame()
 
 
+def p_value_correction(p, method):
+    # Bonferroni is just a multiplication by the number of tests, no need for pingouin
+    p = np.asarray(p, dtype=float)
+    if method == "bonf":
+        return np.minimum(p * len(p), 1.0)
+    # imported here, so pages that never correct p-values don't pay for loading pingouin
+    import pingouin as pg
+
+    return pg.multicomp(p, method=method)[1]
+
+
+@st.cache_resource(max_entries=10)
+def get_joined_data(data_version):
+    # meta data and feature matrix side by side, built once per submitted data set (read only!)
+    return pd.concat([st.session_state.md, st.session_state.data], axis=1)
+
+
 def page_setup():
     # streamlit configs
     st.set_page_config(
@@ -33,6 +51,9 @@ def page_setup():
             st.session_state[key] = pd.DataFrame()
     if "data_preparation_done" not in st.session_state:
         st.session_state["data_preparation_done"] = False
+    # changes with every submitted data set, unique across sessions since the caches are shared
+    if "data_version" not in st.session_state:
+        st.session_state["data_version"] = uuid.uuid4().hex
 
     m = st.markdown(
         """
@@ -2,12 +2,13 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import scipy.stats as stats
+from src.common import get_joined_data
 
 
 @st.cache_data
-def test_equal_variance(attribute, between):
+def test_equal_variance(data_version, attribute, between):
     # test for equal variance
-    data = pd.concat([st.session_state.data, st.session_state.md], axis=1)
+    data = get_joined_data(data_version)
     variance = pd.DataFrame(
         {
             f"{between[0]} - {between[1]}": [
@@ -43,9 +44,9 @@ def test_equal_variance(attribute, between):
 
 
 @st.cache_data
-def test_normal_distribution(attribute, between):
+def test_normal_distribution(data_version, attribute, between):
     # test for normal distribution
-    data = pd.concat([st.session_state.data, st.session_state.md], axis=1)
+    data = get_joined_data(data_version)
     for b in between:
         if st.session_state.md[attribute].value_counts().loc[b] < 3:
             st.warning("You need at least 3 values in each option to test for normality!")
@@ -1,70 +1,115 @@
 import streamlit as st
 import pandas as pd
-import pingouin as pg
 import plotly.express as px
+import plotly.graph_objects as go
 import numpy as np
+import scipy.stats
+from src.common import p_value_correction
 
 
-@st.cache_data
-def gen_ttest_data(ttest_attribute, target_groups, paired, alternative, correction, p_correction):
-    df = pd.concat([st.session_state.data, st.session_state.md], axis=1)
-    ttest = []
-    for col in st.session_state.data.columns:
-        group1 = df[col][df[ttest_attribute] == target_groups[0]]
-        group2 = df[col][df[ttest_attribute] == target_groups[1]]
-        result = pg.ttest(group1, group2, paired, alternative, correction)
-        result["metabolite"] = col
+# resource cache, the result is shared between reruns and is read only,
+# data_version keys it on the submitted data set which is read from session state
+@st.cache_resource
+def gen_ttest_data(data_version, ttest_attribute, target_groups, paired, alternative, correction, p_correction):
+    data = st.session_state.data
+    groups = st.session_state.md.loc[data.index, ttest_attribute]
+    A = data.to_numpy()[(groups == target_groups[0]).to_numpy()]
+    B = data.to_numpy()[(groups == target_groups[1]).to_numpy()]
+    n_A, n_B = len(A), len(B)
+    # paired test is only possible with the same number of observations in both groups
+    paired = paired and n_A == n_B
+
+    v_A, v_B = A.var(axis=0, ddof=1), B.var(axis=0, ddof=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if paired:
+            t, p = scipy.stats.ttest_rel(A, B, axis=0, alternative=alternative)
+            dof = np.full(data.shape[1], n_A - 1, dtype=float)
+            se = np.sqrt((A - B).var(axis=0, ddof=1) / n_A)
+            # Cohen's d-avg for repeated measures
+            d = (A.mean(axis=0) - B.mean(axis=0)) / np.sqrt((v_A + v_B) / 2)
+        else:
+            # Welch's t-test for unequal variances, with "auto" only for unequal sample sizes
+            welch = correction == "True" or (correction == "auto" and n_A != n_B)
+            t, p = scipy.stats.ttest_ind(A, B, axis=0, equal_var=not welch, alternative=alternative)
+            pooled_var = ((n_A - 1) * v_A + (n_B - 1) * v_B) / (n_A + n_B - 2)
+            if welch:
+                se = np.sqrt(v_A / n_A + v_B / n_B)
+                dof = se**4 / ((v_A / n_A) ** 2 / (n_A - 1) + (v_B / n_B) ** 2 / (n_B - 1))
+            else:
+                se = np.sqrt(pooled_var * (1 / n_A + 1 / n_B))
+                dof = np.full(data.shape[1], n_A + n_B - 2, dtype=float)
+            d = (A.mean(axis=0) - B.mean(axis=0)) / np.sqrt(pooled_var)
 
-        ttest.append(result)
+        # 95 % confidence interval of the difference in means
+        t_crit = scipy.stats.t.ppf(0.975 if alternative == "two-sided" else 0.95, dof)
+        ci_low, ci_high = (t - t_crit) * se, (t + t_crit) * se
+    if alternative == "greater":
+        ci_high = np.full_like(ci_high, np.inf)
+    elif alternative == "less":
+        ci_low = np.full_like(ci_low, -np.inf)
 
-    ttest = pd.concat(ttest).set_index("metabolite")
+    ttest = pd.DataFrame(
+        {
+            "T": t,
+            "dof": dof,
+            "alternative": alternative,
+            "p-val": p,
+            "CI95%": list(np.column_stack([ci_low, ci_high]).round(2)),
+            "cohen-d": np.abs(d),
+        },
+        index=pd.Index(data.columns, name="metabolite"),
+    )
     ttest = ttest.dropna()
 
-    ttest.insert(8, "p-corrected", pg.multicomp(ttest["p-val"].astype(float), method=p_correction)[1])
+    ttest.insert(6, "p-corrected", p_value_correction(ttest["p-val"], p_correction))
     # add significance
-    ttest.insert(9, "significance", ttest["p-corrected"] < 0.05)
-    ttest.insert(10, "st.session_state.ttest_attribute", ttest_attribute.replace("ATTRIBUTE_", ""))
-    ttest.insert(11, "A", target_groups[0])
-    ttest.insert(12, "B", target_groups[1])
+    ttest.insert(7, "significance", ttest["p-corrected"] < 0.05)
+    ttest.insert(8, "st.session_state.ttest_attribute", ttest_attribute.replace("ATTRIBUTE_", ""))
+    ttest.insert(9, "A", target_groups[0])
+    ttest.insert(10, "B", target_groups[1])
 
     return ttest.sort_values("p-corrected")
 
 
 @st.cache_resource
 def plot_ttest(df):
-    fig = px.scatter(
-        x=df["T"],
-        y=df["p-corrected"].apply(lambda x: -np.log(x)),
-        template="plotly_white",
-        width=600,
-        height=600,
-        color=df["significance"].apply(lambda x: str(x)),
-        color_discrete_sequence=["#ef553b", "#696880"],
-        hover_name=df.index,
+    neg_log_p = -np.log(df["p-corrected"].to_numpy())
+    colors = np.where(df["significance"].to_numpy(), "#ef553b", "#696880")
+    fig = go.Figure(
+        go.Scattergl(
+            x=df["T"],
+            y=neg_log_p,
+            mode="markers",
+            marker_color=colors,
+            hovertext=df.index,
+        )
     )
+    fig.update_layout(template="plotly_white", width=600, height=600)
     
     xlim = [df["T"].min(), df["T"].max()]
     x_padding = abs(xlim[1]-xlim[0])/5
     fig.update_layout(xaxis=dict(range=[xlim[0]-x_padding, xlim[1]+x_padding]))
 
-    r = df["significance"].sum()
-    if r > 5:
-        r = 5
-    for i in range(r):
-        fig.add_annotation(
-            x=df["T"][i] + (xlim[1] - xlim[0])/12,  # x-coordinate of the annotation
-            y=df["p-corrected"].apply(lambda x: -np.log(x))[
-                i
-            ],  # y-coordinate of the annotation
-            text=df.index[i],  # text to be displayed
-            showarrow=False,  # don't display an arrow pointing to the annotation
-            font=dict(size=10, color="#ef553b"),  # font size of the text
-        )
+    # label the (up to five) most significant metabolites
+    t = df["T"].to_numpy()
+    x_shift = (xlim[1] - xlim[0])/12
+    fig.update_layout(
+        annotations=[
+            dict(
+                x=t[i] + x_shift,
+                y=neg_log_p[i],
+                text=str(df.index[i]),
+                showarrow=False,
+                font=dict(size=10, color="#ef553b"),
+            )
+            for i in range(min(df["significance"].sum(), 5))
+        ]
+    )
 
     fig.update_layout(
         font={"color": "grey", "size": 12, "family": "Sans"},
         title={
-            "text": f"t-test - FEATURE SIGNIFICANCE - {df.iloc[0, 10].upper()}: {df.iloc[0, 11]} - {df.iloc[0, 12]}",
+            "text": f"t-test - FEATURE SIGNIFICANCE - {df['st.session_state.ttest_attribute'].iloc[0].upper()}: {df['A'].iloc[0]} - {df['B'].iloc[0]}",
             "font_color": "#3E3D53",
         },
         xaxis_title="T",
@@ -75,18 +120,18 @@ def plot_ttest(df):
 
 
 @st.cache_resource
-def ttest_boxplot(df_ttest, metabolite):
-    df = pd.concat([st.session_state.md, st.session_state.data], axis=1)
+def ttest_boxplot(data_version, metabolite, attribute, options, pvalue):
+    groups = st.session_state.md.loc[st.session_state.data.index, "ATTRIBUTE_"+attribute]
     df1 = pd.DataFrame(
         {
-            metabolite: df[df["ATTRIBUTE_"+st.session_state.ttest_attribute] == st.session_state.ttest_options[0]].loc[:, metabolite],
-            "option": st.session_state.ttest_options[0],
+            metabolite: st.session_state.data.loc[(groups == options[0]).to_numpy(), metabolite],
+            "option": options[0],
         }
     )
     df2 = pd.DataFrame(
         {
-            metabolite: df[df["ATTRIBUTE_"+st.session_state.ttest_attribute] == st.session_state.ttest_options[1]].loc[:, metabolite],
-            "option": st.session_state.ttest_options[1],
+            metabolite: st.session_state.data.loc[(groups == options[1]).to_numpy(), metabolite],
+            "option": options[1],
         }
     )
     df = pd.concat([df1, df2])
@@ -101,17 +146,16 @@ def ttest_boxplot(df_ttest, metabolite):
     )
     fig.update_layout(
         showlegend=False,
-        xaxis_title=st.session_state.ttest_attribute.replace("st.session_state.ttest_attribute_", ""),
+        xaxis_title=attribute,
         yaxis_title="intensity",
         template="plotly_white",
         font={"color": "grey", "size": 12, "family": "Sans"},
         title={
-            "text": metabolite,
+            "text": str(metabolite),
             "font_color": "#3E3D53",
         },
     )
     fig.update_yaxes(title_standoff=10)
-    pvalue = df_ttest.loc[metabolite, "p-corrected"]
     if pvalue >= 0.05:
         symbol = "ns"
     elif pvalue >= 0.01: